@@ -1,26 +1,56 @@
 #!/usr/bin/env python3
 
 import ast
+import functools
+import hashlib
+import importlib.metadata
+import io
+import json
 import os
 import os.path as op
 import re
+import shutil
+import string
 import sys
 import subprocess
 import tempfile
+import threading
+import time
 import argparse
+import fcntl
 import venv
-from typing import List, Optional, Set, Tuple
+from typing import Iterator, List, Optional, Set, Tuple, Union
 
 
 VERSION = "0.4.2"
 
+# The maximum number of the cached virtual environments for the run command.
+MAX_RUN_VENVS = 8
+
+# The file put in a cached virtual environment when it is ready, whose mtime records its last use.
+RUN_VENV_MARKER = "slothx-complete.txt"
+
+# The cached analysis results older than this (in seconds) are removed when a new one is written.
+ANALYSIS_CACHE_MAX_AGE = 30 * 24 * 60 * 60
+
+# The first version of pipx that provides the 'pipx pin' command.
+PIPX_PIN_MIN_VERSION = (1, 6)
+
 
 class InvalidDependenciesSection(ValueError):
     """Exception raised when the dependencies section is not properly closed."""
     pass
 
 
-def parse_uv_script_style_dependencies(text: str) -> Optional[List[str]]:
+# Patterns used in parsing the uv-script style dependencies section.
+COMMENT_MARKS_RE = re.compile(r'^#\s*|\s*#.*$')  # leading "# " and trailing comments
+SCRIPT_SIGNATURE_RE = re.compile(r"///\s*script$")
+INLINE_DEPENDENCIES_RE = re.compile(r'dependencies\s*=\s*\[(.*?)\]')
+DEPENDENCIES_START_RE = re.compile(r"^dependencies\s*=\s*\[$")
+QUOTED_STRING_RE = re.compile(r'"([^"]+)"')
+
+
+def parse_uv_script_style_dependencies(text: Union[str, bytes]) -> Optional[List[str]]:
     """
     Parses the uv-script style dependencies section from the given text.
 
@@ -31,7 +61,7 @@ def parse_uv_script_style_dependencies(text: str) -> Optional[List[str]]:
     it returns `None`. If an empty section is found, it returns an empty list.
 
     Args:
-        text (str): The Python script text to be parsed.
+        text (Union[str, bytes]): The Python script text (or its UTF-8 encoded bytes) to be parsed.
 
     Returns:
         Optional[List[str]]: A list of dependencies.
@@ -42,10 +72,11 @@ def parse_uv_script_style_dependencies(text: str) -> Optional[List[str]]:
     Raises:
         InvalidDependenciesSection: If the `dependencies` section is not properly closed.
     """
-    lines = text.split("\n")
-
+    # Read the text line by line, as only the leading comment lines are needed (and need decoding)
     stripped_lines = []
-    for line in lines:
+    for line in io.BytesIO(text) if isinstance(text, bytes) else io.StringIO(text):
+        if isinstance(line, bytes):
+            line = line.decode("utf-8", errors="replace")
         line = line.strip()
 
         # Skip empty lines
@@ -58,8 +89,7 @@ def parse_uv_script_style_dependencies(text: str) -> Optional[List[str]]:
             break
 
         # Remove leading "# " and trailing comments
-        line = re.sub(r'^#\s*', '', line)
-        line = re.sub(r'\s*#.*$', '', line)
+        line = COMMENT_MARKS_RE.sub('', line)
 
         stripped_lines.append(line)
 
@@ -77,7 +107,7 @@ def parse_uv_script_style_dependencies(text: str) -> Optional[List[str]]:
             continue
 
         # Look for the script signature
-        if re.match(r"///\s*script$", line):
+        if SCRIPT_SIGNATURE_RE.match(line):
             signature_found = True
 
         if not signature_found:
@@ -85,14 +115,14 @@ def parse_uv_script_style_dependencies(text: str) -> Optional[List[str]]:
 
         if not in_dependencies_section:
             # Look for dependencies = [...] (single-line definition)
-            single_line_match = re.match(r'dependencies\s*=\s*\[(.*?)\]', line)
+            single_line_match = INLINE_DEPENDENCIES_RE.match(line)
             if single_line_match:
                 dependency_lines.append(single_line_match.group(1))
                 dependencies_section_found = True
                 break
 
             # Look for the start of a multi-line dependencies = [
-            if re.match(r"^dependencies\s*=\s*\[$", line):
+            if DEPENDENCIES_START_RE.match(line):
                 in_dependencies_section = True
                 dependencies_section_found = True
                 continue
@@ -120,7 +150,7 @@ def parse_uv_script_style_dependencies(text: str) -> Optional[List[str]]:
     dependencies = []
     for line in dependency_lines:
         # Find all instances of "..." in the line and strip the quotes
-        for match in re.finditer(r'"([^"]+)"', line):
+        for match in QUOTED_STRING_RE.finditer(line):
             dependencies.append(match.group(1))
     
     return dependencies
@@ -128,7 +158,11 @@ def parse_uv_script_style_dependencies(text: str) -> Optional[List[str]]:
 
 def find_third_party_packages(imports: Set[str]) -> List[str]:
     """
-    Create a virtual environment, detect third-party packages, and then remove the virtual environment.
+    Detect third-party packages, i.e., imported packages that are not part of the standard library.
+
+    On Python 3.10 or later, the check is a lookup in `sys.stdlib_module_names`.
+    On older interpreters, the packages that cannot be imported by the current Python interpreter
+    without site-packages are regarded as third-party ones.
 
     Args:
         imports (Set[str]): A set of imported package names from the target script.
@@ -136,154 +170,393 @@ def find_third_party_packages(imports: Set[str]) -> List[str]:
     Returns:
         List[str]: A list of third-party packages that are not part of the standard library.
     """
-    third_party_packages = []
+    if sys.version_info < (3, 10):
+        return find_third_party_packages_by_import(imports)
 
-    # Create a temporary directory and set up a virtual environment
-    with tempfile.TemporaryDirectory() as temp_dir:
-        # Create the virtual environment
-        venv_dir = op.join(temp_dir, "venv")
-        venv.create(venv_dir, with_pip=False)  # Create virtual environment without pip
-        venv_python = op.join(venv_dir, "bin", "python")
+    stdlib = sys.stdlib_module_names | set(sys.builtin_module_names)
 
-        # Add to the list if the package cannot be imported in the virtual environment (i.e., third-party package)
-        for package in imports:
-            package = package.split(".")[0]  # remove submodule name (e.g., "latex2mathml.converter" -> "latex2mathml")
-            if not is_package_in_venv(package, venv_python):
-                third_party_packages.append(package)
+    # remove submodule name (e.g., "latex2mathml.converter" -> "latex2mathml")
+    packages = {package.split(".")[0] for package in imports}
 
-    # The virtual environment is automatically deleted when the with block exits
-    return third_party_packages
+    return sorted(packages - stdlib)
 
 
-def is_package_in_venv(package_name: str, venv_python: str) -> bool:
+def find_third_party_packages_by_import(imports: Set[str]) -> List[str]:
     """
-    Check if a package is part of the standard library by attempting to import it in a clean virtual environment.
+    Detect third-party packages by trying to import them in an isolated Python interpreter without site-packages.
 
     Args:
-        package_name (str): The name of the package to check.
-        venv_python (str): The path to the Python interpreter in the virtual environment.
+        imports (Set[str]): A set of imported package names from the target script.
 
     Returns:
-        bool: True if the package is part of the standard library, False if it's a third-party package.
+        List[str]: A list of third-party packages that are not part of the standard library.
     """
+    # remove submodule name (e.g., "latex2mathml.converter" -> "latex2mathml")
+    packages = sorted({package.split(".")[0] for package in imports})
+    if not packages:
+        return []
+
+    importable = find_importable_packages(packages)
+
+    # Add to the list if the package cannot be imported without site-packages (i.e., third-party package)
+    return [package for package in packages if package not in importable]
+
+
+# Script run by `find_importable_packages`, which reads package names from stdin, one per line,
+# and looks up each of them (without actually importing it).
+IMPORT_PROBE_SCRIPT = """\
+import importlib.util, sys
+for n in sys.stdin.read().split():
     try:
-        subprocess.run(
-            [venv_python, "-c", f"import {package_name}"],
-            check=True,
-            stdout=subprocess.DEVNULL,
-            stderr=subprocess.DEVNULL,
-        )
-        return True  # If import succeeds, it's part of the standard library
-    except subprocess.CalledProcessError:
-        return False  # If import fails, it's a third-party package
+        found = importlib.util.find_spec(n) is not None
+    except Exception:
+        found = False
+    print(n + ("\\tok" if found else "\\tmiss"))
+"""
+
+
+def find_importable_packages(packages: List[str]) -> Set[str]:
+    """
+    Check which packages can be imported with only the standard library, in a single subprocess.
+
+    The current Python interpreter is run in isolated mode (`-I`, which ignores `PYTHON*` environment
+    variables and the user site directory) and without the `site` module (`-S`, so no site-packages),
+    which is equivalent to a clean virtual environment but needs no setup.
+
+    Args:
+        packages (List[str]): The names of the packages to check.
+
+    Returns:
+        Set[str]: The names of the packages that can be imported.
+    """
+    # close_fds=False (with an absolute executable path, and no cwd or preexec_fn) lets subprocess
+    # use posix_spawn instead of fork + exec (see `_use_posix_spawn` in the subprocess module)
+    result = subprocess.run(
+        [sys.executable, "-I", "-S", "-c", IMPORT_PROBE_SCRIPT],
+        input="\n".join(packages),
+        stdout=subprocess.PIPE,
+        stderr=subprocess.DEVNULL,
+        text=True,
+        close_fds=False,
+    )
+
+    importable = set()
+    for line in result.stdout.splitlines():
+        name, _, verdict = line.partition("\t")
+        if verdict == "ok":
+            importable.add(name)
+    return importable
+
+
+# The AST node types of `try` statements (`try ... except*` is available from Python 3.11).
+TRY_NODE_TYPES = tuple(t for t in (ast.Try, getattr(ast, "TryStar", None)) if t is not None)
+
+# `compile` flags to get an AST, optimized one if the interpreter supports it.
+AST_COMPILE_FLAGS = getattr(ast, "PyCF_OPTIMIZED_AST", ast.PyCF_ONLY_AST)
+
+
+def get_cache_dir() -> str:
+    """
+    Get the directory to store the cache files of slothx.
+
+    Returns:
+        str: The path of the cache directory (`$XDG_CACHE_HOME/slothx` or `~/.cache/slothx`).
+    """
+    cache_home = os.environ.get("XDG_CACHE_HOME") or op.join(op.expanduser("~"), ".cache")
+    return op.join(cache_home, "slothx")
+
+
+def analysis_cache_path(source: bytes, deep_scan: bool) -> str:
+    """
+    Get the path of the cache file for the result of `analyze_script`.
+
+    The cache file is keyed by the hash of the script source, the scan mode, the version of slothx,
+    and the Python version, so that an edited script, a changed analysis, or a different interpreter
+    never hits a stale entry.
+
+    Args:
+        source (bytes): The source of the Python script.
+        deep_scan (bool): Whether the whole script is scanned, or only the top-level statements.
+
+    Returns:
+        str: The path of the cache file.
+    """
+    digest = hashlib.blake2b(source, digest_size=16).hexdigest()
+    mode = "deep" if deep_scan else "top"
+    python_version = f"{sys.version_info[0]}.{sys.version_info[1]}"
+    return op.join(get_cache_dir(), "analysis", f"{digest}-{mode}-{VERSION}-{python_version}.json")
+
+
+def iter_top_level_statements(body: List[ast.stmt]) -> Iterator[ast.stmt]:
+    """
+    Iterate over the top-level statements, including those in top-level `if`, `try` and `with` blocks
+    (e.g., `if sys.version_info ...:`, `try: import ... except ImportError: ...` or
+    `with contextlib.suppress(ImportError): import ...`), and those in the body of the top-level `main` function.
+
+    Args:
+        body (List[ast.stmt]): The statements of the module.
+
+    Yields:
+        ast.stmt: The statements.
+    """
+    for node in body:
+        yield node
+        if isinstance(node, ast.If):
+            yield from iter_top_level_statements(node.body)
+            yield from iter_top_level_statements(node.orelse)
+        elif isinstance(node, TRY_NODE_TYPES):
+            yield from iter_top_level_statements(node.body)
+            for handler in node.handlers:
+                yield from iter_top_level_statements(handler.body)
+            yield from iter_top_level_statements(node.orelse)
+            yield from iter_top_level_statements(node.finalbody)
+        elif isinstance(node, (ast.With, ast.AsyncWith)):
+            yield from iter_top_level_statements(node.body)
+        elif isinstance(node, ast.FunctionDef) and node.name == "main":
+            # Scripts often import their dependencies in 'main' to keep the module import cheap
+            yield from iter_top_level_statements(node.body)
+
+
+def prune_analysis_cache(cache_dir: str) -> None:
+    """
+    Remove the cached analysis results that have not been written for `ANALYSIS_CACHE_MAX_AGE` seconds.
 
+    A removed result that is still needed is simply analyzed and written again.
 
-def analyze_script(text: str, filename: str) -> Tuple[Set[str], bool]:
+    Args:
+        cache_dir (str): The directory of the cached analysis results.
+    """
+    expiry = time.time() - ANALYSIS_CACHE_MAX_AGE
+    try:
+        with os.scandir(cache_dir) as it:
+            for entry in it:
+                try:
+                    if entry.stat().st_mtime < expiry:
+                        os.unlink(entry.path)
+                except OSError:
+                    pass  # e.g., removed by another process
+    except OSError:
+        pass
+
+
+def analyze_script(text: Union[str, bytes], filename: str, deep_scan: bool = False) -> Tuple[Set[str], bool]:
     """
     Parse the script to find all import statements and check for the presence of a 'main' function.
 
+    By default, only the top-level statements (see `iter_top_level_statements`) are scanned,
+    as imports and the 'main' function are conventionally placed there.
+
     Args:
-        text (str): Text of the Python script to analyze.
+        text (Union[str, bytes]): Text of the Python script to analyze. When bytes are given,
+            they are decoded by the compiler itself, respecting the encoding declaration if any.
         filename (str): Filename of the Python script to analyze
+        deep_scan (bool): Whether to scan the whole script, including function and class bodies.
 
     Returns:
         Tuple[Set[str], bool]: A tuple containing a set of imported modules and a boolean indicating whether a 'main' function exists.
     """
-    tree = ast.parse(text, filename=filename)
+    cache_path = analysis_cache_path(text if isinstance(text, bytes) else text.encode("utf-8"), deep_scan)
+    try:
+        with open(cache_path, "r", encoding="utf-8") as f:
+            cached = json.load(f)
+        return set(cached["imports"]), cached["has_main"]
+    except (OSError, ValueError, KeyError, TypeError):
+        pass  # Cache miss or broken cache file, analyze the script
+
+    # Let the compiler optimize the tree (on Python 3.13+, where an optimized AST is available),
+    # since neither docstrings nor asserts are needed to find imports or 'main'
+    tree = compile(text, filename, "exec", flags=AST_COMPILE_FLAGS, optimize=2)
 
-    # Collect imported modules
+    # Collect imported modules and check if a 'main' function is defined, in a single traversal
     imports = set()
-    for node in ast.walk(tree):
+    has_main = False
+    nodes = ast.walk(tree) if deep_scan else iter_top_level_statements(tree.body)
+    for node in nodes:
         if isinstance(node, ast.Import):
-            for alias in node.names:
-                imports.add(alias.name)
+            imports.update(alias.name for alias in node.names)
         elif isinstance(node, ast.ImportFrom):
             if node.module:
                 imports.add(node.module)
+        elif not has_main and isinstance(node, ast.FunctionDef) and node.name == "main":
+            has_main = True
 
-    # Check if a 'main' function is defined
-    has_main = any(
-        isinstance(node, ast.FunctionDef) and node.name == "main"
-        for node in ast.walk(tree)
-    )
+    tmp_path = None
+    try:
+        os.makedirs(op.dirname(cache_path), exist_ok=True)
+        # Write to a temporary file and then rename it, so that no one reads a partially written cache file
+        with tempfile.NamedTemporaryFile("w", encoding="utf-8", dir=op.dirname(cache_path), delete=False) as f:
+            tmp_path = f.name
+            json.dump({"imports": sorted(imports), "has_main": has_main}, f)
+        os.replace(tmp_path, cache_path)
+    except OSError:
+        # Caching is just an optimization, but do not leave the temporary file behind
+        if tmp_path is not None:
+            try:
+                os.unlink(tmp_path)
+            except OSError:
+                pass
+    else:
+        prune_analysis_cache(op.dirname(cache_path))
 
     return imports, has_main
 
 
-def generate_pyproject_toml(script_name: str, dependencies: List[str]) -> Tuple[str, str]:
+PYPROJECT_TOML_TEMPLATE = string.Template("""
+[build-system]
+requires = ["setuptools", "wheel"]
+build-backend = "setuptools.build_meta"
+
+[project]
+name = $name
+version = "0.1.0"
+description = $description
+dependencies = $dependencies
+
+[project.scripts]
+$script_key = $entry_point
+""")
+
+# TOML keys that can be written without quotes.
+TOML_BARE_KEY_RE = re.compile(r"[A-Za-z0-9_-]+")
+
+
+def toml_value(value: Union[str, List[str]]) -> str:
     """
-    Generate the content for a pyproject.toml file.
+    Format a string or a list of strings as a TOML value.
+
+    A JSON string (or array of strings) is also a valid TOML one, with the characters properly escaped.
+
+    Args:
+        value (Union[str, List[str]]): The value to format.
+
+    Returns:
+        str: The TOML representation of the value.
+    """
+    return json.dumps(value)
+
+
+def get_package_names(script_name: str) -> Tuple[str, str]:
+    """
+    Derive the tool name and the package (module) name from the name of a script.
 
     Args:
         script_name (str): The name of the Python script.
-        dependencies (List[str]): A list of third-party dependencies.
 
     Returns:
-        Tuple[str, str]: The generated content of the pyproject.toml file and the package name.
+        Tuple[str, str]: The tool name (with hyphens) and the package name (with underscores).
     """
-    # Replace underscores with hyphens for the tool/package name
+    # Replace underscores with hyphens for the tool name
     tool_name = op.splitext(op.basename(script_name))[0].replace("_", "-")
     # Replace hyphens with underscores for the package name
     package_name = tool_name.replace("-", "_")
+    return tool_name, package_name
 
-    pyproject_content = f"""
-[build-system]
-requires = ["setuptools", "wheel"]
-build-backend = "setuptools.build_meta"
 
-[project]
-name = "{tool_name}"
-version = "0.1.0"
-description = "Auto-generated project for {tool_name}"
-dependencies = {dependencies}
+def generate_pyproject_toml(tool_name: str, package_name: str, dependencies: List[str]) -> str:
+    """
+    Generate the content for a pyproject.toml file.
 
-[project.scripts]
-{tool_name} = "{package_name}:main"
-"""
-    return pyproject_content, package_name
+    Args:
+        tool_name (str): The name of the tool (see `get_package_names`).
+        package_name (str): The name of the package providing the `main` entry point.
+        dependencies (List[str]): A list of third-party dependencies.
+
+    Returns:
+        str: The generated content of the pyproject.toml file.
+    """
+    return PYPROJECT_TOML_TEMPLATE.substitute(
+        name=toml_value(tool_name),
+        description=toml_value(f"Auto-generated project for {tool_name}"),
+        dependencies=toml_value(dependencies),
+        script_key=tool_name if TOML_BARE_KEY_RE.fullmatch(tool_name) else toml_value(tool_name),
+        entry_point=toml_value(f"{package_name}:main"),
+    )
 
 
 def create_pyproject_toml_file(
-    script_name: str, dependencies: List[str], output_dir: str
-) -> str:
+    tool_name: str, package_name: str, dependencies: List[str], output_dir: str
+) -> None:
     """
     Create a pyproject.toml file in the given output directory.
 
     Args:
-        script_name (str): The name of the Python script.
+        tool_name (str): The name of the tool (see `get_package_names`).
+        package_name (str): The name of the package providing the `main` entry point.
         dependencies (List[str]): A list of third-party dependencies.
         output_dir (str): The directory in which to create the pyproject.toml file.
-
-    Returns:
-        str: The package name
     """
-    pyproject_content, package_name = generate_pyproject_toml(script_name, dependencies)
+    pyproject_content = generate_pyproject_toml(tool_name, package_name, dependencies)
     pyproject_path = op.join(output_dir, "pyproject.toml")
-    with open(pyproject_path, "w", encoding="utf-8") as f:
-        f.write(pyproject_content)
-    return package_name
+    with open(pyproject_path, "wb") as f:
+        f.write(pyproject_content.encode("utf-8"))
 
 
+@functools.lru_cache(maxsize=1)
 def is_pipx_pin_supported() -> bool:
     """
-    Check if the 'pipx pin' command is supported by running 'pipx pin --help'.
+    Check if the 'pipx pin' command is supported, from the version of the installed pipx (1.6 or later).
+    The result is cached, as it does not change while slothx is running.
 
     Returns:
         bool: True if 'pipx pin' is supported, False otherwise.
     """
     try:
-        # Run 'pipx pin --help' and redirect stderr to /dev/null
-        result = subprocess.run(
-            [sys.executable, "-m", "pipx", "pin", "--help"],
-            stdout=subprocess.DEVNULL,
-            stderr=subprocess.DEVNULL,
-        )
-        return result.returncode == 0
-    except Exception as e:
-        # If any error occurs, we assume 'pipx pin' is not supported
-        print(f"Error checking pipx pin support: {e}", file=sys.stderr, flush=True)
+        version = importlib.metadata.version("pipx")
+    except importlib.metadata.PackageNotFoundError:
         return False
 
+    m = re.match(r"(\d+)\.(\d+)", version)
+    if not m:
+        return False
+    return (int(m.group(1)), int(m.group(2))) >= PIPX_PIN_MIN_VERSION
+
+
+def run_pipx(args: List[str]) -> int:
+    """
+    Run a pipx command.
+
+    The command is run in-process when pipx can be imported from the current Python interpreter,
+    saving the startup of another interpreter. Otherwise, it falls back to `python -m pipx`.
+
+    Args:
+        args (List[str]): The arguments to pipx (e.g., `["install", "--force", path]`).
+
+    Returns:
+        int: The exit code of the pipx command.
+    """
+    try:
+        from pipx.main import cli as pipx_cli
+    except Exception:  # not only ImportError, as a broken pipx may raise anything while being imported
+        # Use the current Python interpreter to invoke pipx
+        return subprocess.run([sys.executable, "-m", "pipx"] + args).returncode
+
+    # pipx's CLI entry point reads its arguments from sys.argv
+    saved_argv = sys.argv
+    sys.argv = ["pipx"] + args
+    try:
+        return int(pipx_cli())
+    except SystemExit as e:
+        if e.code is None:
+            return 0
+        if isinstance(e.code, int):
+            return e.code
+        # sys.exit() with a message, which the interpreter would print before exiting
+        print(e.code, file=sys.stderr, flush=True)
+        return 1
+    finally:
+        sys.argv = saved_argv
+
+
+def prewarm_pipx() -> None:
+    """
+    Import pipx ahead of time (intended to run on a background thread while the script is analyzed),
+    so that `run_pipx` finds it already loaded.
+    """
+    try:
+        import pipx.main
+    except Exception:
+        pass  # `run_pipx` will fall back to a subprocess
+
 
 def install_with_pipx(package_name: str, temp_dir: str, force: bool = False, pin: bool = False) -> None:
     """
@@ -295,20 +568,15 @@ def install_with_pipx(package_name: str, temp_dir: str, force: bool = False, pin
         pin (bool): Whether to pin the installed package to prevent upgrades.
     """
     # Install the package using pipx
-    cmd = [
-        sys.executable,
-        "-m",
-        "pipx",
-        "install",
-    ]  # Use the current Python interpreter to invoke pipx
+    args = ["install"]
     if force:
-        cmd.append("--force")
-    cmd.append(temp_dir)
+        args.append("--force")
+    args.append(temp_dir)
 
     # Run the pipx install command
-    result = subprocess.run(cmd)
-    if result.returncode != 0:
-        sys.exit(result.returncode)
+    returncode = run_pipx(args)
+    if returncode != 0:
+        sys.exit(returncode)
 
     # If pinning is enabled, attempt to pin the package
     if pin:
@@ -316,18 +584,98 @@ def install_with_pipx(package_name: str, temp_dir: str, force: bool = False, pin
             print("Warning: 'pipx pin' is not supported in your version of pipx. Skipping pinning.", file=sys.stderr, flush=True)
             return
 
-        cmd = [
-            sys.executable,
-            "-m",
-            "pipx",
-            "pin",
-            package_name,
-        ]
-        result = subprocess.run(cmd)
-        if result.returncode != 0:
+        returncode = run_pipx(["pin", package_name])
+        if returncode != 0:
             # If pinning fails, display a helpful message
-            print(f"Error: pipx failed to pin the package {package_name} with exit code {result.returncode}", file=sys.stderr, flush=True)
-            sys.exit(result.returncode)
+            print(f"Error: pipx failed to pin the package {package_name} with exit code {returncode}", file=sys.stderr, flush=True)
+            sys.exit(returncode)
+
+
+def run_venv_dir(dependencies: List[str]) -> str:
+    """
+    Get the path of the cached virtual environment for running scripts with the given dependencies.
+
+    The path is keyed by the hash of the (sorted) dependencies and the current Python interpreter,
+    so that scripts with the same dependencies share a virtual environment.
+
+    Args:
+        dependencies (List[str]): A list of third-party dependencies.
+
+    Returns:
+        str: The path of the virtual environment directory.
+    """
+    key_source = "\n".join([sys.executable, sys.version] + sorted(dependencies))
+    key = hashlib.sha256(key_source.encode("utf-8")).hexdigest()
+    return op.join(get_cache_dir(), "run-venvs", key)
+
+
+def create_run_venv(venv_dir: str, dependencies: List[str]) -> int:
+    """
+    Create a virtual environment and install the dependencies in it.
+
+    Args:
+        venv_dir (str): The directory in which to create the virtual environment.
+        dependencies (List[str]): A list of third-party dependencies to install.
+
+    Returns:
+        int: The exit code of the failed command, or 0 on success.
+    """
+    venv_python = op.join(venv_dir, "bin", "python")
+
+    venv.create(venv_dir, with_pip=True)
+
+    # Pass the dependencies to the installer as a requirements file (kept in the virtual environment),
+    # so that they are resolved all at once
+    requirements_path = op.join(venv_dir, "requirements.txt")
+    with open(requirements_path, "w", encoding="utf-8") as f:
+        f.write("".join(d + "\n" for d in dependencies))
+
+    # Install wheel and the dependencies with a single pip invocation
+    cmd = [
+        venv_python, "-m", "pip", "install", "--disable-pip-version-check", "--no-input",
+        "wheel", "-r", requirements_path,
+    ]
+    result = subprocess.run(cmd)
+    if result.returncode != 0:
+        print(f"Error: Failed to install dependencies: {' '.join(dependencies)}", file=sys.stderr, flush=True)
+        return result.returncode
+
+    return 0
+
+
+def evict_run_venvs(keep: str) -> None:
+    """
+    Remove the least recently used cached virtual environments, leaving at most `MAX_RUN_VENVS` of them.
+
+    Args:
+        keep (str): The path of a virtual environment that must not be removed (the one in use).
+            The ones locked by other processes are not removed either.
+    """
+    run_venvs_dir = op.dirname(keep)
+    entries = []
+    for name in os.listdir(run_venvs_dir):
+        d = op.join(run_venvs_dir, name)
+        if d == keep or name.endswith(".lock"):
+            continue
+        try:
+            last_used = os.stat(op.join(d, RUN_VENV_MARKER)).st_mtime
+        except OSError:
+            continue  # A virtual environment being created (or a broken one), leave it to its creator
+        entries.append((last_used, d))
+
+    entries.sort(reverse=True)
+    for _, d in entries[MAX_RUN_VENVS - 1:]:
+        with open(d + ".lock", "a") as lock_file:
+            try:
+                fcntl.flock(lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except OSError:
+                continue  # In use (or being created) by another process
+            # Remove the marker first, so that a half-removed virtual environment is not regarded as completed
+            try:
+                os.unlink(op.join(d, RUN_VENV_MARKER))
+            except OSError:
+                continue  # Already evicted by another process
+            shutil.rmtree(d, ignore_errors=True)
 
 
 def run_script(
@@ -336,30 +684,69 @@ def run_script(
     """
     Run the specified script with the provided arguments.
 
+    If uv is available, the script is run with `uv run`, which manages (and caches) the environment by itself.
+    Otherwise, the virtual environment with the dependencies installed is cached across invocations,
+    so that running a script again (or another script with the same dependencies) skips the installation.
+
     Args:
         script_path (str): The path to the Python script to run.
         script_args (List[str]): A list of arguments to pass to the script.
+        dependencies (List[str]): A list of third-party dependencies to install before running the script.
     
     Returns:
         int: The exit code of the script.
     """
-    with tempfile.TemporaryDirectory() as temp_dir:
-        venv_dir = op.join(temp_dir, "venv")
-        venv.create(venv_dir, with_pip=True)
-        venv_python = op.join(venv_dir, "bin", "python")
+    uv = shutil.which("uv")
+    if uv is not None:
+        # Run the script with the current Python interpreter in an environment isolated from any project
+        # (including the one in the current directory) and from the packages of the interpreter itself
+        cmd = [uv, "run", "--no-project", "--isolated", "--python", sys.executable]
+        for dependency in dependencies:
+            cmd.extend(["--with", dependency])
+        # Run the file with the interpreter of the environment, since uv runs only a `.py`/`.pyw` path as a script
+        # and resolves anything else (e.g., an extensionless script) as a command
+        cmd.extend(["python", script_path])
+        result = subprocess.run(cmd + script_args)
+        return result.returncode
 
-        cmd = [venv_python, "-m", "pip", "install", "wheel"]
-        result = subprocess.run(cmd)
-        if result.returncode != 0:
-            print("Error: Failed to install wheel", file=sys.stderr, flush=True)
-            return result.returncode
+    venv_dir = run_venv_dir(dependencies)
+    venv_python = op.join(venv_dir, "bin", "python")
+    marker_path = op.join(venv_dir, RUN_VENV_MARKER)
+    os.makedirs(op.dirname(venv_dir), exist_ok=True)
+
+    # The lock file is placed next to the virtual environment and never removed,
+    # so that all the processes lock the same file
+    with open(venv_dir + ".lock", "a") as lock_file:
+        while True:
+            # Hold a shared lock while checking the virtual environment and running the script,
+            # so that other processes can use the virtual environment at the same time, but cannot evict it
+            fcntl.flock(lock_file, fcntl.LOCK_SH)
+            if op.exists(marker_path):
+                # Mark the virtual environment as recently used
+                os.utime(marker_path)
+                break
 
-        for dependency in dependencies:
-            cmd = [venv_python, "-m", "pip", "install", dependency]
-            result = subprocess.run(cmd)
-            if result.returncode != 0:
-                print(f"Error: Failed to install dependency: {dependency}", file=sys.stderr, flush=True)
-                return result.returncode
+            # Hold an exclusive lock only while creating and marking the virtual environment
+            fcntl.flock(lock_file, fcntl.LOCK_EX)
+
+            # The conversion to the exclusive lock is not atomic, so another process may have created it in between
+            if not op.exists(marker_path):
+                # Remove the remains of a failed creation, if any
+                shutil.rmtree(venv_dir, ignore_errors=True)
+
+                returncode = create_run_venv(venv_dir, dependencies)
+                if returncode != 0:
+                    shutil.rmtree(venv_dir, ignore_errors=True)
+                    return returncode
+
+                # Mark the virtual environment as completed
+                with open(marker_path, "w", encoding="utf-8") as f:
+                    f.write("".join(d + "\n" for d in dependencies))
+
+                evict_run_venvs(venv_dir)
+
+            # Go back to the shared lock, checking the marker again,
+            # since the virtual environment may be evicted while the lock is converted
 
         print("---", file=sys.stderr, flush=True)
 
@@ -369,19 +756,45 @@ def run_script(
         return result.returncode
 
 
+def get_fast_temp_dir() -> Optional[str]:
+    """
+    Find a writable directory on a RAM-backed file system (tmpfs) for short-lived temporary files.
+
+    Returns:
+        Optional[str]: The path of the directory, or `None` to use the default temporary directory
+            (when `TMPDIR` is set explicitly, or no such directory is found, e.g., on macOS or Windows).
+    """
+    if os.environ.get("TMPDIR") or not hasattr(os, "getuid"):
+        return None
+
+    for d in ("/dev/shm", f"/run/user/{os.getuid()}"):
+        if op.isdir(d) and os.access(d, os.W_OK | os.X_OK):
+            return d
+    return None
+
+
 def copy_script(orig_path: str, copy_path: str, add_stub_main: bool = False) -> None:
     stat_info = os.stat(orig_path)
-    am_time = stat_info.st_atime, stat_info.st_mtime
 
-    with open(orig_path, 'rb') as f_orig:
-        data = f_orig.read()
+    if not add_stub_main:
+        # The script is used as it is, so a hard link is enough when both are on the same file system
+        if stat_info.st_dev == os.stat(op.dirname(op.abspath(copy_path))).st_dev:
+            try:
+                os.link(orig_path, copy_path)
+                return
+            except OSError:
+                pass  # e.g., the file system does not support hard links, fall back to copying
+        shutil.copyfile(orig_path, copy_path)  # uses zero-copy system calls where available
+    else:
+        with open(orig_path, 'rb') as f_orig:
+            data = f_orig.read()
 
-    if add_stub_main:
         data = b'__name__, main = "__main__", lambda: None\n' + data
 
-    with open(copy_path, 'wb') as f_copy:
-        f_copy.write(data)
+        with open(copy_path, 'wb') as f_copy:
+            f_copy.write(data)
 
+    am_time = stat_info.st_atime, stat_info.st_mtime
     os.utime(copy_path, am_time)
 
 
@@ -414,6 +827,11 @@ def main() -> None:
         action="store_true",
         help="Do not pin the installed package.",
     )
+    install_parser.add_argument(
+        "--deep-scan",
+        action="store_true",
+        help="Find imports also in function and class bodies, not only in top-level statements.",
+    )
     install_parser.add_argument(
         "-t", "--pyproject-toml",
         action="store_true",
@@ -423,12 +841,23 @@ def main() -> None:
     # Run subcommand
     run_parser = subparsers.add_parser("run", help="Run the script with arguments.")
     run_parser.add_argument("script", help="Python script file to run.")
+    run_parser.add_argument(
+        "--deep-scan",
+        action="store_true",
+        help="Find imports also in function and class bodies, not only in top-level statements.",
+    )
     run_parser.add_argument(
         "script_args", nargs=argparse.REMAINDER, help="Arguments to pass to the script."
     )
 
     args = parser.parse_args()
 
+    # Load pipx in the background while the script is analyzed
+    prewarm_thread = None
+    if args.command == "install" and not args.pyproject_toml:
+        prewarm_thread = threading.Thread(target=prewarm_pipx, daemon=True)
+        prewarm_thread.start()
+
     script_file = args.script
 
     # Check if the script file exists
@@ -437,10 +866,10 @@ def main() -> None:
         sys.exit(1)
 
     # Analyze the script for imports and the existence of a main function
-    with open(script_file, "r", encoding="utf-8") as inp:
+    with open(script_file, "rb") as inp:
         script_text = inp.read()
 
-    imports, has_main = analyze_script(script_text, script_file)
+    imports, has_main = analyze_script(script_text, script_file, args.deep_scan)
 
     # Detect third-party packages
     dependency_descriptions = parse_uv_script_style_dependencies(script_text)
@@ -448,25 +877,30 @@ def main() -> None:
         dependency_descriptions = find_third_party_packages(imports)
 
     if args.command == "install":
+        tool_name, package_name = get_package_names(script_file)
+
         if args.pyproject_toml:
             # Output the pyproject.toml content to stdout or install with pipx
-            pyproject_content, _ = generate_pyproject_toml(script_file, dependency_descriptions)
+            pyproject_content = generate_pyproject_toml(tool_name, package_name, dependency_descriptions)
             print(pyproject_content)
             return
 
         # Use the absolute path of the script to avoid issues with relative paths
         abs_script_path = op.abspath(script_file)
 
-        # Create a temporary directory
-        with tempfile.TemporaryDirectory() as temp_dir:
-            # Copy the script to the temporary directory, replacing '-' with '_' in the filename
-            filename_for_package = op.basename(abs_script_path).replace("-", "_")
+        # Create a temporary directory, which is the only one used by the command.
+        # It only holds small files, so place it on a RAM-backed file system if possible.
+        with tempfile.TemporaryDirectory(dir=get_fast_temp_dir()) as temp_dir:
+            # Copy the script to the temporary directory, as the module of the package
+            filename_for_package = package_name + op.splitext(abs_script_path)[1]
             copy_script(abs_script_path, op.join(temp_dir, filename_for_package), add_stub_main=not has_main)
 
             # Generate pyproject.toml in the temporary directory
-            package_name = create_pyproject_toml_file(abs_script_path, dependency_descriptions, temp_dir)
+            create_pyproject_toml_file(tool_name, package_name, dependency_descriptions, temp_dir)
 
             # Install with pipx
+            if prewarm_thread is not None:
+                prewarm_thread.join()
             install_with_pipx(package_name, temp_dir, args.force, not args.no_pinning)
     elif args.command == "run":
         # Run the script with the provided arguments
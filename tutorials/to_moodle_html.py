@@ -1,33 +1,28 @@
 import sys
 import argparse
 import re
+from functools import lru_cache
 
-from bs4 import BeautifulSoup
+from bs4 import BeautifulSoup, FeatureNotFound
 from markdown import markdown
 from latex2mathml.converter import convert as l2m_convert
 
 
-def split_code_block_iter(lines):
-    in_code_block = False
-    for line in lines:
-        m = re.match(r"^```\s*(.*)", line)
-        if m:
-            additional_desc = m.group(1)
-            if additional_desc:
-                in_code_block = True
-                yield None, line
-            else:
-                if not in_code_block:
-                    in_code_block = True
-                    yield None, line
-                else:
-                    in_code_block = False
-                    yield None, line
-        else:
-            if not in_code_block:
-                yield line, None
-            else:
-                yield None, line
+BLOCK_MATH_RE = re.compile(r"\$\$(.+?)\$\$", re.DOTALL | re.MULTILINE)
+
+# Inline math (group 1: the equation), an unpaired dollar sign, or a code fence (if at the beginning of a line)
+INLINE_MATH_OR_FENCE_RE = re.compile(r"\$([^\n]+?)\$|\$|```")
+
+
+@lru_cache(maxsize=4096)
+def convert_math(s, display):
+    # The same equations (e.g. `$x$`, `$n$`) tend to appear many times in a document
+    return l2m_convert(s, display=display)
+
+
+def replace_block_math(match):
+    s = match.group(1)
+    return convert_math(s, "block")
 
 
 def format_latex_math_blocks(text):
@@ -40,33 +35,50 @@ def format_latex_math_blocks(text):
     if double_dollar_count % 2 != 0:
         raise ValueError("The number of '$$' symbols is odd.")
 
-    def replace_block_math(match):
-        s = match.group(1)
-        return l2m_convert(s, display="block")
+    text = BLOCK_MATH_RE.sub(replace_block_math, text)
 
-    text = re.sub(r"\$\$(.+?)\$\$", replace_block_math, text, flags=re.DOTALL | re.MULTILINE)
-
-    it = split_code_block_iter(text.split("\n"))
+    # Convert inline math $...$ in a single scan over the text, skipping code blocks.
+    # Only the backquotes and dollar signs are visited; the other text is copied in spans.
     r = []
-    for i, (line, code_block_line) in enumerate(it):
-        if line is None:
-            assert code_block_line is not None
-            r.append(code_block_line)
+    copied = 0
+    in_code_block = False
+    pos = 0
+    while True:
+        m = INLINE_MATH_OR_FENCE_RE.search(text, pos)
+        if m is None:
+            break
+        start, pos = m.start(), m.end()
+
+        if m.group() == "```":
+            if start != 0 and text[start - 1] != "\n":
+                continue  # not a code fence
+            line_end = text.find("\n", start)
+            if line_end < 0:
+                line_end = len(text)
+            # A code fence with a description always starts a code block, otherwise it toggles
+            in_code_block = True if text[pos:line_end].strip() else not in_code_block
+            pos = line_end
+            continue
+        if in_code_block:
             continue
 
-        single_dollar_count = line.count("$")
-        if single_dollar_count % 2 != 0:
-            raise ValueError("The number of '$' symbols is odd: {line}")
-
-        # Convert inline math $...$
-        def replace_inline_math(match):
-            s = match.group(1)
-            return l2m_convert(s, display="inline")
+        # A line has an odd number of '$' only if it has an unpaired '$', or math beginning with '$'
+        math = m.group(1)
+        if math is None or math.startswith("$"):
+            line_start = text.rfind("\n", 0, start) + 1
+            line_end = text.find("\n", start)
+            line = text[line_start:line_end] if line_end >= 0 else text[line_start:]
+            if line.count("$") % 2 != 0:
+                raise ValueError(f"The number of '$' symbols is odd: {line}")
+            if math is None:
+                continue
 
-        line = re.sub(r"\$(.+?)\$", replace_inline_math, line)
-        r.append(line)
+        r.append(text[copied:start])
+        r.append(convert_math(math, "inline"))
+        copied = pos
 
-    return "\n".join(r)
+    r.append(text[copied:])
+    return "".join(r)
 
 
 def main():
@@ -93,23 +105,36 @@ def main():
 
     # Convert Markdown to HTML
     html = markdown(text, extensions=["fenced_code", "tables"])
-    soup = BeautifulSoup(html, "html.parser")
-
-    # Add border attribute to tables
-    tables = soup.find_all("table")
-    for t in tables:
-        t.attrs["border"] = "1"
-
-    # Add style to <pre> tags
-    pres = soup.find_all("pre")
-    for t in pres:
-        s = t.attrs.setdefault("style", "")
-        s = s.rstrip()
-        if s and not s.endswith(";"):
-            s = s + ";"
-        t.attrs["style"] = s + "background-color: #e8e8e8; padding: 10px;"
-
-    print(soup.prettify())
+    try:
+        # lxml is much faster than the builtin parser, but wraps the fragment in <html><body>
+        soup = BeautifulSoup(html, "lxml")
+        root = soup.body
+        # lxml also moves leading <style>, <script>, <meta>, <link> and <title> into an implied <head>,
+        # which would be lost from the output, so leave such a document to the builtin parser
+        if root is None or (soup.head is not None and soup.head.contents):
+            root = None
+    except FeatureNotFound:
+        root = None
+    if root is None:
+        soup = root = BeautifulSoup(html, "html.parser")
+
+    # Find tables and <pre> tags in a single traversal
+    for t in soup.find_all(["table", "pre"]):
+        if t.name == "table":
+            # Add border attribute to tables
+            t.attrs["border"] = "1"
+        else:
+            # Add style to <pre> tags
+            s = t.attrs.setdefault("style", "")
+            s = s.rstrip()
+            if s and not s.endswith(";"):
+                s = s + ";"
+            t.attrs["style"] = s + "background-color: #e8e8e8; padding: 10px;"
+
+    if root is soup:
+        print(soup.prettify())
+    else:
+        print(root.decode_contents(indent_level=0))
 
 
 if __name__ == "__main__":